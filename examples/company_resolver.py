@@ -5,11 +5,18 @@ This module demonstrates how to develop a function that resolves company names
 in text using a database of company IDs and URLs.
 """
 
-from typing import List, Dict, Any
-from pydantic import BaseModel
+import asyncio
+import functools
+import re
+from urllib.parse import urlsplit
+from typing import List, Dict, Any, Tuple, Callable, TypeVar, Pattern, Iterator
+import httpx
+from pydantic import BaseModel, ValidationError
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage
+from langchain_core.caches import InMemoryCache
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.utils.json import parse_json_markdown
 from contracts import (
     specification,
     pre_description,
@@ -22,6 +29,8 @@ from contracts import (
     PostconditionViolation,
 )
 
+T = TypeVar("T")
+
 
 class CompanyMatch(BaseModel):
     """Pydantic model for LLM-resolved company matches."""
@@ -37,45 +46,189 @@ class CompanyMatchList(BaseModel):
     matches: List[CompanyMatch]
 
 
-def entity_resolve_llm_precondition(
-    text: str, company_database: List[Dict[str, Any]]
-) -> bool:
-    """Precondition: text must be non-empty and database must contain valid company records."""
-    if not isinstance(text, str) or len(text.strip()) == 0:
-        return False
+# The output parser and its format instructions depend only on
+# CompanyMatchList, so they are built once at import rather than per call.
+_PARSER = PydanticOutputParser(pydantic_object=CompanyMatchList)
+_FORMAT_INSTRUCTIONS = _PARSER.get_format_instructions()
+
+# Responses are cached on the exact prompt and model settings, so resolving
+# the same text against the same database again skips the API call. Each key
+# holds the whole rendered database, so the cache is bounded; the oldest
+# response is evicted once it is full.
+_LLM_CACHE_MAX = 256
+_LLM_CACHE = InMemoryCache(maxsize=_LLM_CACHE_MAX)
+
+# Values derived from a company database, keyed by what was derived and the
+# id() of the database. Each entry keeps the list itself, so the id cannot be
+# recycled while cached, and the length it had, so appending or removing
+# records forces a rebuild. Editing a record in place is not detected.
+_DATABASE_CACHE: Dict[Tuple[str, int], Tuple[List[Dict[str, Any]], int, Any]] = {}
+_DATABASE_CACHE_MAX = 64
+
+
+# Requests with a text and database no larger than these limits go to
+# SMALL_MODEL; anything bigger escalates to LARGE_MODEL.
+SMALL_MODEL = "gpt-4o-mini"
+LARGE_MODEL = "gpt-4o"
+SMALL_MODEL_MAX_TEXT_LENGTH = 2000
+SMALL_MODEL_MAX_DATABASE_SIZE = 20
+
+
+def _select_model(text: str, company_database: List[Dict[str, Any]]) -> str:
+    """Pick the cheapest model tier suited to the size of the request."""
+    if (
+        len(text) <= SMALL_MODEL_MAX_TEXT_LENGTH
+        and len(company_database) <= SMALL_MODEL_MAX_DATABASE_SIZE
+    ):
+        return SMALL_MODEL
+    return LARGE_MODEL
+
+
+# One pooled HTTP client shared by every model tier, so sync requests reuse
+# keep-alive connections to the API instead of paying a new TLS handshake.
+# Timeouts match the OpenAI SDK defaults.
+_HTTP_CLIENT = httpx.Client(
+    timeout=httpx.Timeout(600.0, connect=5.0),
+    limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_llm(model_name: str) -> ChatOpenAI:
+    """Return the shared chat model for a model name, creating it on first use."""
+    return ChatOpenAI(
+        model_name=model_name,
+        temperature=0,
+        cache=_LLM_CACHE,
+        http_client=_HTTP_CLIENT,
+    )
+
+
+def _per_database(
+    kind: str,
+    company_database: List[Dict[str, Any]],
+    build: Callable[[List[Dict[str, Any]]], T],
+    cache_failures: bool = True,
+) -> T:
+    """
+    Return build(company_database), computed once per database.
+
+    With cache_failures=False a falsy result is not cached, so a check that
+    failed is run again on the next call, for example after a bad record has
+    been fixed in place.
+    """
+    key = (kind, id(company_database))
+    cached = _DATABASE_CACHE.get(key)
+    if cached is not None and cached[1] == len(company_database):
+        return cached[2]
+
+    value = build(company_database)
+    if not value and not cache_failures:
+        return value
+    if len(_DATABASE_CACHE) >= _DATABASE_CACHE_MAX:
+        _DATABASE_CACHE.clear()
+    _DATABASE_CACHE[key] = (company_database, len(company_database), value)
+    return value
+
+
+def _company_keywords(company: Dict[str, Any]) -> List[str]:
+    """
+    Lowercased strings whose presence in a text suggests it mentions the company.
+
+    These are the full name, the first word of the name and the longest label
+    of the URL host below the top-level domain, so "https://google.com"
+    contributes "google" and "https://bbc.co.uk" contributes "bbc".
+    """
+    name = company["name"].strip().lower()
+    keywords = [name, name.split()[0]]
+    url = company["url"].strip().lower()
+    # Without a scheme urlsplit reads "google.com" as a path, not a host
+    try:
+        host = urlsplit(url if "//" in url else "//" + url).hostname or ""
+    except ValueError:
+        # Malformed URLs such as unbalanced IPv6 brackets give no host keyword
+        host = ""
+    labels = [label for label in host.split(".") if label and label != "www"]
+    if labels:
+        keywords.append(max(labels[:-1] or labels, key=len))
+    return keywords
+
+
+def _build_keyword_pattern(company_database: List[Dict[str, Any]]) -> Pattern[str]:
+    """Compile one regex matching any keyword of any company in the database."""
+    keywords = {
+        keyword
+        for company in company_database
+        for keyword in _company_keywords(company)
+    }
+    return re.compile("|".join(re.escape(keyword) for keyword in sorted(keywords)))
+
+
+def _mentions_any_company(text: str, company_database: List[Dict[str, Any]]) -> bool:
+    """
+    Check cheaply whether the text could refer to any company in the database.
+
+    This only filters out texts that share no keyword with any company, so a
+    company referred to solely by a name the database does not know (such as
+    a former brand) is missed.
+    """
+    pattern = _per_database("keyword_pattern", company_database, _build_keyword_pattern)
+    return pattern.search(text.lower()) is not None
 
-    if not isinstance(company_database, list):
-        return False
 
+def _records_valid(company_database: List[Dict[str, Any]]) -> bool:
+    """Check that every record is a dict with an int id and non-empty name and url."""
     for record in company_database:
-        if not isinstance(record, dict):
+        if type(record) is not dict:
             return False
-        required_fields = {"id", "name", "url"}
-        if not required_fields.issubset(record.keys()):
+        if "id" not in record or "name" not in record or "url" not in record:
             return False
-        if not isinstance(record["id"], int):
+        if type(record["id"]) is not int:
             return False
-        if not isinstance(record["name"], str) or len(record["name"].strip()) == 0:
+        if type(record["name"]) is not str or len(record["name"].strip()) == 0:
             return False
-        if not isinstance(record["url"], str) or len(record["url"].strip()) == 0:
+        if type(record["url"]) is not str or len(record["url"].strip()) == 0:
             return False
 
     return True
 
 
+def entity_resolve_llm_precondition(
+    text: str, company_database: List[Dict[str, Any]]
+) -> bool:
+    """Precondition: text must be non-empty and database must contain valid company records."""
+    if not isinstance(text, str) or len(text.strip()) == 0:
+        return False
+
+    if not isinstance(company_database, list):
+        return False
+
+    return _per_database(
+        "records_valid", company_database, _records_valid, cache_failures=False
+    )
+
+
 def entity_resolve_llm_postcondition(
     result: List[CompanyMatch], text: str, company_database: List[Dict[str, Any]]
 ) -> bool:
     """Postcondition: result must be valid CompanyMatch objects with correct constraints."""
-    if not isinstance(result, list):
+    if type(result) is not list:
         return False
 
     # If database is empty, result should be empty
     if len(company_database) == 0:
         return len(result) == 0
 
+    valid_ids = frozenset(db_record.get("id") for db_record in company_database)
+
+    # Every match needs its own id from the database, so a longer result
+    # must contain a duplicate or an unknown id
+    if len(result) > len(valid_ids):
+        return False
+
+    seen_ids = set()
     for match in result:
-        if not isinstance(match, CompanyMatch):
+        if type(match) is not CompanyMatch:
             return False
 
         # Check that matched_text exists in the input text
@@ -83,22 +236,14 @@ def entity_resolve_llm_postcondition(
             return False
 
         # Check that company_id corresponds to a valid database entry
-        found_in_db = False
-        for db_record in company_database:
-            if db_record.get("id") == match.company_id:
-                found_in_db = True
-                break
-
-        if not found_in_db:
+        if match.company_id not in valid_ids:
             return False
 
         # Check that confidence is between 0.0 and 1.0
         if not (0.0 <= match.confidence <= 1.0):
             return False
 
-    # No duplicate company_ids in result
-    seen_ids = set()
-    for match in result:
+        # No duplicate company_ids in result
         if match.company_id in seen_ids:
             return False
         seen_ids.add(match.company_id)
@@ -106,6 +251,94 @@ def entity_resolve_llm_postcondition(
     return True
 
 
+# Everything that does not depend on the text goes in the system message,
+# ahead of the text, so the provider can reuse its cached prompt prefix. The
+# fixed part is built once so every request starts with the same bytes.
+_SYSTEM_PROMPT_PREFIX = f"""
+You are an expert at entity resolution. Given a text and a database of companies, identify any company names or variations mentioned in the text and match them to the correct company ID from the database.
+
+For each company you find in the text:
+1. Extract the exact text that refers to the company
+2. Match it to the correct company ID from the database
+3. Assign a confidence score between 0.0 and 1.0 based on how certain you are of the match
+
+Rules:
+- Only match companies that actually appear in the text (even if abbreviated or slightly different)
+- Use exact text spans from the input text for matched_text
+- Confidence should be 1.0 for exact matches, lower for fuzzy matches
+- If no companies are found, return an empty list
+
+{_FORMAT_INSTRUCTIONS}
+
+Company Database:
+"""
+
+
+def _build_system_prompt(company_database: List[Dict[str, Any]]) -> str:
+    """Render the system prompt for a database, in id order so the same records always give the same bytes."""
+    company_context = "\n".join(
+        [
+            f"ID: {company['id']}, Name: {company['name']}, URL: {company['url']}"
+            for company in sorted(company_database, key=lambda company: company["id"])
+        ]
+    )
+    return _SYSTEM_PROMPT_PREFIX + company_context + "\n"
+
+
+# A run of one to five words repeated four or more times in a row
+_REPEATED_RUN = re.compile(r"\b((?:\w+\W+){1,5}?)\1{3,}")
+
+
+def _compact_text(text: str) -> str:
+    """
+    Collapse runs of repeated words to a single copy before sending text to the LLM.
+
+    Repeated runs add prompt tokens without adding mentions. A span of the
+    compacted text also occurs in the original unless it covers a whole
+    collapsed run plus text on both sides, and matches are still checked
+    against the original text.
+    """
+    return _REPEATED_RUN.sub(r"\1", text)
+
+
+def _build_messages(
+    text: str, company_database: List[Dict[str, Any]]
+) -> List[BaseMessage]:
+    """Build the chat messages asking the LLM to resolve companies in text."""
+    system_prompt = _per_database(
+        "system_prompt", company_database, _build_system_prompt
+    )
+
+    return [
+        SystemMessage(content=system_prompt),
+        HumanMessage(content=f'Text to analyze:\n"{_compact_text(text)}"'),
+    ]
+
+
+# The outermost JSON object in a response, whether or not it is fenced
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def _parse_matches(content: str) -> List[CompanyMatch]:
+    """Parse the LLM's structured output, treating unparseable output as no matches."""
+    # Validate the JSON directly with pydantic-core, and only fall back to
+    # LangChain's more lenient parser when that fails. Content that is a list
+    # of blocks rather than a string is left to the parser.
+    found = _JSON_OBJECT.search(content) if isinstance(content, str) else None
+    if found is not None:
+        try:
+            return CompanyMatchList.model_validate_json(found.group(0)).matches
+        except ValidationError:
+            pass
+
+    try:
+        parsed_result = _PARSER.parse(content)
+        return parsed_result.matches
+    except Exception:
+        # Fallback to empty list if parsing fails
+        return []
+
+
 @specification(
     "We have a list of company names and their ids, we will send these to an LLM, along with a text and ask it to associate a new exact string name it finds with a company id if it appears to be the same entity. It should use a pydantic model to constrain the LLM output and return this instead of a dictionary."
 )
@@ -135,55 +368,227 @@ def entity_resolve_llm(
     if len(company_database) == 0:
         return []
 
-    # Initialize GPT-4 model
-    llm = ChatOpenAI(model_name="gpt-4", temperature=0)
+    # Skip the LLM round trip when no company could possibly be mentioned
+    if not _mentions_any_company(text, company_database):
+        return []
 
-    # Set up Pydantic output parser
-    parser = PydanticOutputParser(pydantic_object=CompanyMatchList)
+    llm = _get_llm(_select_model(text, company_database))
+    response = llm.invoke(_build_messages(text, company_database))
+    return _parse_matches(response.content)
 
-    # Create company database context for the LLM
-    company_context = "\n".join(
-        [
-            f"ID: {company['id']}, Name: {company['name']}, URL: {company['url']}"
-            for company in company_database
-        ]
+
+def entity_resolve_llm_batch_precondition(
+    texts: List[str], company_database: List[Dict[str, Any]], max_concurrency: int = 10
+) -> bool:
+    """Precondition: every text must satisfy entity_resolve_llm's precondition and max_concurrency must be positive."""
+    if not isinstance(texts, list) or not isinstance(company_database, list):
+        return False
+
+    if type(max_concurrency) is not int or max_concurrency < 1:
+        return False
+
+    for text in texts:
+        if not isinstance(text, str) or len(text.strip()) == 0:
+            return False
+
+    return _per_database(
+        "records_valid", company_database, _records_valid, cache_failures=False
     )
 
-    # Create the prompt
-    prompt = f"""
-You are an expert at entity resolution. Given a text and a database of companies, identify any company names or variations mentioned in the text and match them to the correct company ID from the database.
 
-Company Database:
-{company_context}
+def _matches_from_response_postcondition(
+    result: List[CompanyMatch],
+    content: str,
+    text: str,
+    company_database: List[Dict[str, Any]],
+) -> bool:
+    """Postcondition: parsed matches must satisfy entity_resolve_llm's postcondition for their text."""
+    return entity_resolve_llm_postcondition(result, text, company_database)
 
-Text to analyze:
-"{text}"
 
-For each company you find in the text:
-1. Extract the exact text that refers to the company
-2. Match it to the correct company ID from the database
-3. Assign a confidence score between 0.0 and 1.0 based on how certain you are of the match
+@postcondition(_matches_from_response_postcondition)
+def _matches_from_response(
+    content: str, text: str, company_database: List[Dict[str, Any]]
+) -> List[CompanyMatch]:
+    """Parse one batched LLM response, checking it against the text it was asked about."""
+    return _parse_matches(content)
 
-Rules:
-- Only match companies that actually appear in the text (even if abbreviated or slightly different)
-- Use exact text spans from the input text for matched_text
-- Confidence should be 1.0 for exact matches, lower for fuzzy matches
-- If no companies are found, return an empty list
 
-{parser.get_format_instructions()}
-"""
+@specification(
+    "Resolves company names in many texts at once by running entity_resolve_llm's LLM request for each text concurrently, with at most max_concurrency requests in flight."
+)
+@pre_description(
+    "Texts must be a list of non-empty strings, database must be a list of valid company records with 'id', 'name', and 'url' fields, and max_concurrency must be a positive integer"
+)
+@post_description(
+    "Returns one list of CompanyMatch objects per text, in the order of texts, each satisfying entity_resolve_llm's postcondition for its text"
+)
+@raises([PreconditionViolation, PostconditionViolation])
+@precondition(entity_resolve_llm_batch_precondition)
+async def entity_resolve_llm_batch(
+    texts: List[str], company_database: List[Dict[str, Any]], max_concurrency: int = 10
+) -> List[List[CompanyMatch]]:
+    """
+    Resolve company entities in many texts with concurrent LLM requests.
 
-    # Send request to LLM
-    message = HumanMessage(content=prompt)
-    response = llm.invoke([message])
+    Args:
+        texts: The input texts to search for company names
+        company_database: List of company records with 'id', 'name', and 'url' fields
+        max_concurrency: Maximum number of LLM requests in flight at once
 
-    # Parse the response
+    Returns:
+        One list of CompanyMatch objects per input text, in the same order
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def resolve(text: str) -> List[CompanyMatch]:
+        if len(company_database) == 0 or not _mentions_any_company(text, company_database):
+            return []
+        llm = _get_llm(_select_model(text, company_database))
+        async with semaphore:
+            response = await llm.ainvoke(_build_messages(text, company_database))
+        return _matches_from_response(response.content, text, company_database)
+
+    return list(await asyncio.gather(*(resolve(text) for text in texts)))
+
+
+@specification(
+    "Resolves company names in many texts at once with LangChain's batch API, sending one LLM request per text from a thread pool with at most max_concurrency requests in flight."
+)
+@pre_description(
+    "Texts must be a list of non-empty strings, database must be a list of valid company records with 'id', 'name', and 'url' fields, and max_concurrency must be a positive integer"
+)
+@post_description(
+    "Returns one list of CompanyMatch objects per text, in the order of texts, each satisfying entity_resolve_llm's postcondition for its text"
+)
+@raises([PreconditionViolation, PostconditionViolation])
+@precondition(entity_resolve_llm_batch_precondition)
+def entity_resolve_llm_many(
+    texts: List[str], company_database: List[Dict[str, Any]], max_concurrency: int = 10
+) -> List[List[CompanyMatch]]:
+    """
+    Resolve company entities in many texts with batched LLM requests.
+
+    Args:
+        texts: The input texts to search for company names
+        company_database: List of company records with 'id', 'name', and 'url' fields
+        max_concurrency: Maximum number of LLM requests in flight at once
+
+    Returns:
+        One list of CompanyMatch objects per input text, in the same order
+    """
+    results: List[List[CompanyMatch]] = [[] for _ in texts]
+
+    # Group the texts worth sending by model tier, one batch call per model
+    pending: Dict[str, List[int]] = {}
+    for index, text in enumerate(texts):
+        if len(company_database) > 0 and _mentions_any_company(text, company_database):
+            pending.setdefault(_select_model(text, company_database), []).append(index)
+
+    for model_name, indices in pending.items():
+        responses = _get_llm(model_name).batch(
+            [_build_messages(texts[index], company_database) for index in indices],
+            config={"max_concurrency": max_concurrency},
+        )
+        for index, response in zip(indices, responses):
+            results[index] = _matches_from_response(
+                response.content, texts[index], company_database
+            )
+
+    return results
+
+
+def _partial_match_items(buffer: str) -> List[Any]:
+    """Return the raw match items parsed so far from a partial LLM response."""
     try:
-        parsed_result = parser.parse(response.content)
-        return parsed_result.matches
-    except Exception as e:
-        # Fallback to empty list if parsing fails
+        partial = parse_json_markdown(buffer)
+    except Exception:
+        return []
+    if not isinstance(partial, dict) or not isinstance(partial.get("matches"), list):
         return []
+    return partial["matches"]
+
+
+def _streamed_matches_postcondition(
+    result: List[CompanyMatch],
+    matches: List[CompanyMatch],
+    text: str,
+    company_database: List[Dict[str, Any]],
+) -> bool:
+    """Postcondition: the matches streamed so far must satisfy entity_resolve_llm's postcondition."""
+    return entity_resolve_llm_postcondition(result, text, company_database)
+
+
+@postcondition(_streamed_matches_postcondition)
+def _streamed_matches(
+    matches: List[CompanyMatch], text: str, company_database: List[Dict[str, Any]]
+) -> List[CompanyMatch]:
+    """Return the matches streamed so far, checking them as a result of entity_resolve_llm."""
+    return matches
+
+
+@specification(
+    "Streaming variant of entity_resolve_llm that yields each CompanyMatch as soon as the LLM has finished generating it, so callers can start work before the full response arrives."
+)
+@pre_description(
+    "Text must be a non-empty string and database must be a list of valid company records with 'id', 'name', and 'url' fields"
+)
+@post_description(
+    "Yields the CompanyMatch objects entity_resolve_llm would return for the same response, except that if a later item fails validation the matches already yielded before it are kept, where entity_resolve_llm returns no matches; with contracts enabled every prefix of the yielded matches satisfies entity_resolve_llm's postcondition"
+)
+@raises([PreconditionViolation, PostconditionViolation])
+@precondition(entity_resolve_llm_precondition)
+def entity_resolve_llm_stream(
+    text: str, company_database: List[Dict[str, Any]]
+) -> Iterator[CompanyMatch]:
+    """
+    Resolve company entities in text, yielding matches while the LLM streams.
+
+    Matches are yielded before the whole response has been parsed. If a
+    later item turns out to be invalid, the response as a whole does not
+    parse and entity_resolve_llm would return no matches for it, but the
+    matches yielded before that item have already reached the caller.
+
+    Args:
+        text: The input text to search for company names
+        company_database: List of company records with 'id', 'name', and 'url' fields
+
+    Yields:
+        CompanyMatch objects in the order the LLM produces them, possibly
+        only a prefix of them when the response fails to parse
+    """
+    if len(company_database) == 0 or not _mentions_any_company(text, company_database):
+        return
+
+    llm = _get_llm(_select_model(text, company_database))
+    matches: List[CompanyMatch] = []
+
+    def accept(match: CompanyMatch) -> CompanyMatch:
+        # A generator's result cannot be checked by @postcondition, so the
+        # postcondition is applied to each prefix as it is yielded
+        matches.append(match)
+        _streamed_matches(matches, text, company_database)
+        return match
+
+    buffer = ""
+    streaming = True
+    for chunk in llm.stream(_build_messages(text, company_database)):
+        buffer += chunk.content
+        # Items only change shape when an object opens or closes, so the
+        # buffer is not re-parsed for chunks inside a string or number
+        if not streaming or ("{" not in chunk.content and "}" not in chunk.content):
+            continue
+        items = _partial_match_items(buffer)
+        # The last item may still be incomplete, so it is held back
+        while streaming and len(matches) < len(items) - 1:
+            try:
+                yield accept(CompanyMatch.model_validate(items[len(matches)]))
+            except ValidationError:
+                # Leave this and everything after it to the final parse
+                streaming = False
+
+    for match in _parse_matches(buffer)[len(matches):]:
+        yield accept(match)
 
 
 if __name__ == "__main__":
@@ -6,14 +6,21 @@ Design by Contract programming with runtime verification.
 """
 
 import functools
+import inspect
+import linecache
 import os
-from typing import Any, Callable, TypeVar, List, Type
+import threading
+from typing import Any, Callable, Dict, Optional, Sequence, TypeVar, List, Tuple, Type
 
 F = TypeVar('F', bound=Callable[..., Any])
 
 # Global flag to enable/disable contract checking
 _CONTRACT_CHECKING_ENABLED = os.environ.get('CONTRACTS_ENABLED', '').lower() in ('1', 'true', 'yes')
 
+# When set, logical condition decorators record their conditions but return
+# the function unwrapped, so decorated calls carry no checking overhead at all
+_CONTRACTS_OPTIMIZED = os.environ.get('CONTRACTS_OPTIMIZED', '').lower() in ('1', 'true', 'yes')
+
 
 class ContractViolation(Exception):
     """Base exception for contract violations."""
@@ -58,7 +65,12 @@ class DontImplementThis(Exception):
 
 
 def enable_contracts() -> None:
-    """Enable contract checking at runtime."""
+    """
+    Enable contract checking at runtime.
+    
+    Functions decorated while CONTRACTS_OPTIMIZED was set have no checking
+    wrapper, so their contracts stay off regardless of this flag.
+    """
     global _CONTRACT_CHECKING_ENABLED
     _CONTRACT_CHECKING_ENABLED = True
 
@@ -74,6 +86,14 @@ def contracts_enabled() -> bool:
     return _CONTRACT_CHECKING_ENABLED
 
 
+def _metadata(func: Callable[..., Any]) -> Dict[str, Any]:
+    """Return a function's contract metadata dict, creating it if needed."""
+    metadata = getattr(func, '_contract_metadata', None)
+    if metadata is None:
+        metadata = func._contract_metadata = {}
+    return metadata
+
+
 def specification(description: str) -> Callable[[F], F]:
     """
     Decorator to add a specification description to a function.
@@ -85,9 +105,7 @@ def specification(description: str) -> Callable[[F], F]:
         The decorated function with specification metadata
     """
     def decorator(func: F) -> F:
-        if not hasattr(func, '_contract_metadata'):
-            func._contract_metadata = {}
-        func._contract_metadata['specification'] = description
+        _metadata(func)['specification'] = description
         return func
     return decorator
 
@@ -103,9 +121,7 @@ def pre_description(description: str) -> Callable[[F], F]:
         The decorated function with precondition description metadata
     """
     def decorator(func: F) -> F:
-        if not hasattr(func, '_contract_metadata'):
-            func._contract_metadata = {}
-        func._contract_metadata['pre_description'] = description
+        _metadata(func)['pre_description'] = description
         return func
     return decorator
 
@@ -121,9 +137,7 @@ def post_description(description: str) -> Callable[[F], F]:
         The decorated function with postcondition description metadata
     """
     def decorator(func: F) -> F:
-        if not hasattr(func, '_contract_metadata'):
-            func._contract_metadata = {}
-        func._contract_metadata['post_description'] = description
+        _metadata(func)['post_description'] = description
         return func
     return decorator
 
@@ -139,9 +153,7 @@ def invariant_description(description: str) -> Callable[[F], F]:
         The decorated function with invariant description metadata
     """
     def decorator(func: F) -> F:
-        if not hasattr(func, '_contract_metadata'):
-            func._contract_metadata = {}
-        func._contract_metadata['invariant_description'] = description
+        _metadata(func)['invariant_description'] = description
         return func
     return decorator
 
@@ -150,20 +162,274 @@ def raises(exceptions: List[Type[Exception]]) -> Callable[[F], F]:
     """
     Decorator to specify the list of possible exceptions a function can raise.
     
+    The exception types are stored as a frozenset under ``raises`` for
+    constant-time membership tests, with the order they were given in kept
+    as a tuple under ``raises_order``.
+    
     Args:
         exceptions: A list of exception types that the function may raise
         
     Returns:
         The decorated function with exception specification metadata
     """
+    declared = frozenset(exceptions)
+    order = tuple(exceptions)
+    
     def decorator(func: F) -> F:
-        if not hasattr(func, '_contract_metadata'):
-            func._contract_metadata = {}
-        func._contract_metadata['raises'] = exceptions
+        metadata = _metadata(func)
+        metadata['raises'] = declared
+        metadata['raises_order'] = order
         return func
     return decorator
 
 
+def pure(func: F) -> F:
+    """
+    Decorator to declare that a function has no side effects.
+    
+    A pure function cannot change anything its invariants observe, so an
+    invariant that held before the call still holds after it and is only
+    checked once. This is a promise about the decorated function, not the
+    conditions: a function that mutates its arguments must not be marked
+    pure even if all its conditions are.
+    
+    Args:
+        func: The function to mark as side-effect free
+        
+    Returns:
+        The decorated function with purity metadata
+    """
+    _metadata(func)['pure'] = True
+    return func
+
+
+# Violation raised for each kind of check
+_VIOLATIONS: Dict[str, Type[ContractViolation]] = {
+    'precondition': PreconditionViolation,
+    'invariant': InvariantViolation,
+    'postcondition': PostconditionViolation,
+}
+
+# Factories for signature-specific wrappers, keyed by parameter names and
+# the number of those that are positional-only
+_WRAPPER_FACTORIES: Dict[Tuple[Tuple[str, ...], int], Callable[..., Any]] = {}
+
+# Names the generated wrapper source relies on, which parameters must not shadow
+_WRAPPER_RESERVED_NAMES = frozenset({'_func', '_checked', '_CONTRACT_CHECKING_ENABLED'})
+
+
+def _specialized_wrapper(
+    func: Callable[..., Any], checked: Callable[..., Any]
+) -> Optional[Callable[..., Any]]:
+    """
+    Generate a wrapper with the same parameters as a function.
+    
+    A generic ``*args, **kwargs`` wrapper packs a tuple and a dict on every
+    call, even while checking is disabled. When all parameters are
+    positional-only or positional-or-keyword ones without defaults, the
+    generated wrapper declares the same parameters and forwards them
+    directly instead, only handing off to ``checked`` when contracts are
+    enabled. Wrapper source is compiled once per distinct parameter list.
+    
+    Because the generated wrapper binds the arguments itself, a call with
+    the wrong arguments raises ``TypeError`` before any precondition runs,
+    where the generic wrapper would report the precondition failing to
+    evaluate as a ``PreconditionViolation``.
+    
+    Args:
+        func: The function being wrapped
+        checked: The generic wrapper that runs the contract checks
+        
+    Returns:
+        The specialized wrapper, or None if the signature is not supported
+    """
+    try:
+        parameters = inspect.signature(func, follow_wrapped=False).parameters
+    except (TypeError, ValueError):
+        return None
+    
+    positional_only = 0
+    for parameter in parameters.values():
+        if parameter.default is not inspect.Parameter.empty:
+            return None
+        if parameter.kind is inspect.Parameter.POSITIONAL_ONLY:
+            positional_only += 1
+        elif parameter.kind is not inspect.Parameter.POSITIONAL_OR_KEYWORD:
+            return None
+    names = tuple(parameters)
+    if _WRAPPER_RESERVED_NAMES.intersection(names):
+        return None
+    
+    key = (names, positional_only)
+    factory = _WRAPPER_FACTORIES.get(key)
+    if factory is None:
+        arguments = ', '.join(names)
+        if positional_only:
+            declared = ', '.join(names[:positional_only] + ('/',) + names[positional_only:])
+        else:
+            declared = arguments
+        source = (
+            f"def make_wrapper(_func, _checked):\n"
+            f"    def wrapper({declared}):\n"
+            f"        if not _CONTRACT_CHECKING_ENABLED:\n"
+            f"            return _func({arguments})\n"
+            f"        return _checked({arguments})\n"
+            f"    return wrapper\n"
+        )
+        # Register the source so tracebacks through the wrapper show its lines
+        filename = f"<contract wrapper ({declared})>"
+        linecache.cache[filename] = (
+            len(source), None, source.splitlines(keepends=True), filename
+        )
+        # Module globals let the wrapper see later changes to the flag
+        namespace: Dict[str, Any] = {}
+        exec(compile(source, filename, 'exec'), globals(), namespace)
+        factory = _WRAPPER_FACTORIES[key] = namespace['make_wrapper']
+    return factory(func, checked)
+
+
+def _contract_wrapper(
+    func: Callable[..., Any],
+    on_entry: Sequence[Tuple[str, Callable[..., bool]]] = (),
+    on_exit: Sequence[Tuple[str, Callable[..., bool], bool]] = (),
+) -> Any:
+    """
+    Wrap a function in a checking wrapper with one more layer of checks.
+    
+    Stacked precondition, postcondition and invariant decorators share one
+    wrapper that runs flat lists of conditions, so a function with several
+    conditions pays for a single extra call frame rather than one per
+    condition. Decorating an existing checking wrapper builds a new one
+    around the same function, with the new checks outside the existing
+    ones: entry checks run before them and exit checks after them, as they
+    would with one wrapper per decorator. A wrapper that has been returned
+    is never changed.
+    
+    Args:
+        func: The function being decorated, or an existing checking wrapper
+        on_entry: ``(kind, condition)`` pairs to check before the call
+        on_exit: ``(kind, condition, outermost_only)`` triples to check
+                 after the call, where ``outermost_only`` skips the check on
+                 calls nested inside another checked call
+        
+    Returns:
+        A new checking wrapper, whose ``_contract_checks`` hold the checks
+        in the order they are evaluated
+    """
+    wrapped = func
+    on_entry = list(on_entry)
+    on_exit = list(on_exit)
+    if getattr(func, '_contract_wrapper', None) is func:
+        checks = func._contract_checks
+        on_entry += checks['on_entry']
+        on_exit[:0] = checks['on_exit']
+        func = checks['function']
+    metadata = _metadata(func)
+    
+    # Per-thread count of active checked calls, kept only while some
+    # postcondition is limited to the outermost call
+    call_depth = threading.local()
+    
+    # Violation messages only depend on the function, so build them once
+    name = getattr(func, '__name__', repr(func))
+    entry_checks = [
+        (
+            condition,
+            _VIOLATIONS[kind],
+            kind,
+            f"Precondition violated for function {name}"
+            if kind == 'precondition'
+            else f"Invariant violated before execution of {name}",
+        )
+        for kind, condition in on_entry
+    ]
+    exit_checks = [
+        (
+            condition,
+            _VIOLATIONS[kind],
+            kind,
+            f"Postcondition violated for function {name}"
+            if kind == 'postcondition'
+            else f"Invariant violated after execution of {name}",
+            kind == 'postcondition',
+            outermost_only,
+        )
+        for kind, condition, outermost_only in on_exit
+    ]
+    track_depth = any(outermost_only for _, _, outermost_only in on_exit)
+    
+    def wrapper(*args, **kwargs):
+        if not _CONTRACT_CHECKING_ENABLED:
+            return func(*args, **kwargs)
+        
+        # Check preconditions and invariants, outermost first
+        for condition, violation, kind, violated in entry_checks:
+            try:
+                satisfied = condition(*args, **kwargs)
+            except violation:
+                raise
+            except Exception as e:
+                raise violation(
+                    f"Error evaluating {kind} for {name}: {e}"
+                ) from e
+            if not satisfied:
+                raise violation(violated)
+        
+        nested = False
+        if track_depth:
+            depth = getattr(call_depth, 'depth', 0)
+            nested = depth > 0
+            call_depth.depth = depth + 1
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                call_depth.depth = depth
+        else:
+            result = func(*args, **kwargs)
+        
+        # Check invariants and postconditions, innermost first. A pure
+        # function cannot have broken an invariant that held before the call.
+        pure = metadata.get('pure')
+        for (condition, violation, kind, violated,
+                is_postcondition, outermost_only) in exit_checks:
+            if is_postcondition:
+                if nested and outermost_only:
+                    continue
+            elif pure:
+                continue
+            try:
+                if is_postcondition:
+                    satisfied = condition(result, *args, **kwargs)
+                else:
+                    satisfied = condition(*args, **kwargs)
+            except violation:
+                raise
+            except Exception as e:
+                raise violation(
+                    f"Error evaluating {kind} for {name}: {e}"
+                ) from e
+            if not satisfied:
+                raise violation(violated)
+        
+        return result
+    
+    specialized = _specialized_wrapper(func, wrapper)
+    if specialized is not None:
+        wrapper = specialized
+    functools.update_wrapper(wrapper, wrapped)
+    
+    # Mark the wrapper as our own. A foreign decorator applied on top copies
+    # these attributes through functools.wraps, but the identity check above
+    # then fails and the next contract decorator starts a fresh wrapper.
+    wrapper._contract_wrapper = wrapper
+    wrapper._contract_checks = {
+        'function': func,
+        'on_entry': on_entry,
+        'on_exit': on_exit,
+    }
+    return wrapper
+
+
 def precondition(condition: Callable[..., bool]) -> Callable[[F], F]:
     """
     Decorator to add a precondition to a function.
@@ -176,38 +442,18 @@ def precondition(condition: Callable[..., bool]) -> Callable[[F], F]:
         The decorated function with precondition checking
     """
     def decorator(func: F) -> F:
-        if not hasattr(func, '_contract_metadata'):
-            func._contract_metadata = {}
-        
-        if 'preconditions' not in func._contract_metadata:
-            func._contract_metadata['preconditions'] = []
-        func._contract_metadata['preconditions'].append(condition)
+        _metadata(func).setdefault('preconditions', []).append(condition)
         
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            if _CONTRACT_CHECKING_ENABLED:
-                # Check precondition
-                try:
-                    if not condition(*args, **kwargs):
-                        raise PreconditionViolation(
-                            f"Precondition violated for function {func.__name__}"
-                        )
-                except Exception as e:
-                    if isinstance(e, PreconditionViolation):
-                        raise
-                    raise PreconditionViolation(
-                        f"Error evaluating precondition for {func.__name__}: {e}"
-                    )
-            
-            return func(*args, **kwargs)
+        if _CONTRACTS_OPTIMIZED:
+            return func
         
-        # Copy contract metadata to wrapper
-        wrapper._contract_metadata = func._contract_metadata
-        return wrapper
+        return _contract_wrapper(func, on_entry=[('precondition', condition)])
     return decorator
 
 
-def postcondition(condition: Callable[..., bool]) -> Callable[[F], F]:
+def postcondition(
+    condition: Callable[..., bool], outermost_only: bool = False
+) -> Callable[[F], F]:
     """
     Decorator to add a postcondition to a function.
     
@@ -215,41 +461,24 @@ def postcondition(condition: Callable[..., bool]) -> Callable[[F], F]:
         condition: A function that takes the result as first argument,
                   followed by the original function arguments, and returns
                   True if the postcondition is satisfied
+        outermost_only: Only check the postcondition when the call is not
+                  nested inside another checked call of the same function
+                  in this thread, so that recursive functions are checked
+                  once per top-level call instead of once per level
                   
     Returns:
         The decorated function with postcondition checking
     """
     def decorator(func: F) -> F:
-        if not hasattr(func, '_contract_metadata'):
-            func._contract_metadata = {}
+        _metadata(func).setdefault('postconditions', []).append(condition)
         
-        if 'postconditions' not in func._contract_metadata:
-            func._contract_metadata['postconditions'] = []
-        func._contract_metadata['postconditions'].append(condition)
-        
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            result = func(*args, **kwargs)
-            
-            if _CONTRACT_CHECKING_ENABLED:
-                # Check postcondition
-                try:
-                    if not condition(result, *args, **kwargs):
-                        raise PostconditionViolation(
-                            f"Postcondition violated for function {func.__name__}"
-                        )
-                except Exception as e:
-                    if isinstance(e, PostconditionViolation):
-                        raise
-                    raise PostconditionViolation(
-                        f"Error evaluating postcondition for {func.__name__}: {e}"
-                    )
-            
-            return result
+        if _CONTRACTS_OPTIMIZED:
+            return func
         
-        # Copy contract metadata to wrapper
-        wrapper._contract_metadata = func._contract_metadata
-        return wrapper
+        return _contract_wrapper(
+            func,
+            on_exit=[('postcondition', condition, outermost_only)],
+        )
     return decorator
 
 
@@ -265,62 +494,166 @@ def invariant(condition: Callable[..., bool]) -> Callable[[F], F]:
         The decorated function with invariant checking
     """
     def decorator(func: F) -> F:
-        if not hasattr(func, '_contract_metadata'):
-            func._contract_metadata = {}
+        _metadata(func).setdefault('invariants', []).append(condition)
         
-        if 'invariants' not in func._contract_metadata:
-            func._contract_metadata['invariants'] = []
-        func._contract_metadata['invariants'].append(condition)
+        if _CONTRACTS_OPTIMIZED:
+            return func
         
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            if _CONTRACT_CHECKING_ENABLED:
-                # Check invariant before execution
-                try:
-                    if not condition(*args, **kwargs):
-                        raise InvariantViolation(
-                            f"Invariant violated before execution of {func.__name__}"
-                        )
-                except Exception as e:
-                    if isinstance(e, InvariantViolation):
-                        raise
-                    raise InvariantViolation(
-                        f"Error evaluating invariant for {func.__name__}: {e}"
-                    )
-            
-            result = func(*args, **kwargs)
-            
-            if _CONTRACT_CHECKING_ENABLED:
-                # Check invariant after execution
-                try:
-                    if not condition(*args, **kwargs):
-                        raise InvariantViolation(
-                            f"Invariant violated after execution of {func.__name__}"
-                        )
-                except Exception as e:
-                    if isinstance(e, InvariantViolation):
-                        raise
-                    raise InvariantViolation(
-                        f"Error evaluating invariant for {func.__name__}: {e}"
-                    )
-            
-            return result
+        return _contract_wrapper(
+            func,
+            on_entry=[('invariant', condition)],
+            on_exit=[('invariant', condition, False)],
+        )
+    return decorator
+
+
+def contract(
+    *,
+    specification: Optional[str] = None,
+    pre_description: Optional[str] = None,
+    post_description: Optional[str] = None,
+    invariant_description: Optional[str] = None,
+    raises: Optional[List[Type[Exception]]] = None,
+    preconditions: Sequence[Callable[..., bool]] = (),
+    postconditions: Sequence[Callable[..., bool]] = (),
+    invariants: Sequence[Callable[..., bool]] = (),
+) -> Callable[[F], F]:
+    """
+    Decorator to attach a whole contract to a function in one application.
+    
+    Accepts the same information as the individual specification and
+    logical condition decorators and installs it at once, as one layer of
+    checks on the shared checking wrapper. Preconditions and then
+    invariants are checked in the order given before the call; after it,
+    invariants are checked again in reverse order, followed by the
+    postconditions in the order given.
+    
+    Args:
+        specification: A verbal description of what the function does
+        pre_description: A verbal description of the preconditions
+        post_description: A verbal description of the postconditions
+        invariant_description: A verbal description of the invariants
+        raises: A list of exception types that the function may raise
+        preconditions: Conditions on the function arguments
+        postconditions: Conditions on the result followed by the arguments
+        invariants: Conditions on the arguments, checked before and after
+        
+    Returns:
+        The decorated function with contract metadata and checking
+    """
+    preconditions = list(preconditions)
+    postconditions = list(postconditions)
+    invariants = list(invariants)
+    descriptions = {
+        'specification': specification,
+        'pre_description': pre_description,
+        'post_description': post_description,
+        'invariant_description': invariant_description,
+    }
+    if raises is not None:
+        descriptions['raises'] = frozenset(raises)
+        descriptions['raises_order'] = tuple(raises)
+    
+    def decorator(func: F) -> F:
+        metadata = _metadata(func)
+        for key, value in descriptions.items():
+            if value is not None:
+                metadata[key] = value
+        for key, conditions in (
+            ('preconditions', preconditions),
+            ('postconditions', postconditions),
+            ('invariants', invariants),
+        ):
+            if conditions:
+                metadata.setdefault(key, []).extend(conditions)
+        
+        if _CONTRACTS_OPTIMIZED or not (preconditions or postconditions or invariants):
+            return func
         
-        # Copy contract metadata to wrapper
-        wrapper._contract_metadata = func._contract_metadata
-        return wrapper
+        return _contract_wrapper(
+            func,
+            on_entry=[('precondition', c) for c in preconditions]
+            + [('invariant', c) for c in invariants],
+            on_exit=[('invariant', c, False) for c in reversed(invariants)]
+            + [('postcondition', c, False) for c in postconditions],
+        )
     return decorator
 
 
+# Number of results a cached condition keeps before starting over
+_CONDITION_CACHE_MAX = 1024
+
+# Marks a cache miss, since a condition may legitimately return None
+_MISSING = object()
+
+
+def _cache_key(value: Any) -> Any:
+    """
+    Return a hashable key that tells apart values of different types.
+    
+    Equal values of different types, such as ``1``, ``1.0`` and ``True``,
+    hash alike, including when they are nested in tuples or frozensets, so
+    the type of every element is made part of the key.
+    """
+    if isinstance(value, tuple):
+        return (type(value), tuple(_cache_key(item) for item in value))
+    if isinstance(value, frozenset):
+        return (type(value), frozenset(_cache_key(item) for item in value))
+    return (type(value), value)
+
+
+def cached_condition(condition: Callable[..., bool]) -> Callable[..., bool]:
+    """
+    Decorator to memoize a condition on hashable arguments.
+    
+    Conditions are side-effect free, so when a function is called again
+    with the same hashable arguments the condition's earlier answer can be
+    reused instead of re-evaluating it. Arguments only count as the same
+    when their types also match, down to the elements of nested tuples and
+    frozensets. Only use this for conditions over immutable values: an
+    object that is hashable but mutable (for example one hashed by
+    identity) would keep getting the answer for its old state. Calls with
+    unhashable arguments are evaluated directly.
+    
+    Args:
+        condition: A precondition, postcondition or invariant function
+        
+    Returns:
+        The condition backed by a bounded cache, with ``cache_clear`` to
+        reset it
+    """
+    cache: Dict[Any, bool] = {}
+    
+    @functools.wraps(condition)
+    def checked(*args, **kwargs):
+        try:
+            key = _cache_key((args, tuple(kwargs.items())))
+            result = cache.get(key, _MISSING)
+        except TypeError:
+            return condition(*args, **kwargs)
+        if result is _MISSING:
+            result = condition(*args, **kwargs)
+            if len(cache) >= _CONDITION_CACHE_MAX:
+                cache.clear()
+            cache[key] = result
+        return result
+    
+    checked.cache_clear = cache.clear
+    return checked
+
+
 __all__ = [
     'specification',
     'pre_description',
     'post_description',
     'invariant_description',
     'raises',
+    'pure',
     'precondition',
     'postcondition',
     'invariant',
+    'contract',
+    'cached_condition',
     'enable_contracts',
     'disable_contracts',
     'contracts_enabled',
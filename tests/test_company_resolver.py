@@ -0,0 +1,55 @@
+"""Tests for the local helpers of the company resolver example."""
+
+import unittest
+
+from examples.company_resolver import (
+    _compact_text,
+    _company_keywords,
+    _mentions_any_company,
+)
+
+
+class CompactTextTests(unittest.TestCase):
+    def test_repeated_runs_collapse_to_one_copy(self) -> None:
+        text = "Apple " * 100 + "and Microsoft " * 50 + "are mentioned many times."
+
+        self.assertEqual(
+            _compact_text(text), "Apple and Microsoft are mentioned many times."
+        )
+
+    def test_text_without_repeats_is_unchanged(self) -> None:
+        text = "Apple and Microsoft are major tech companies. Google is too."
+
+        self.assertEqual(_compact_text(text), text)
+
+
+class CompanyKeywordTests(unittest.TestCase):
+    def test_url_without_scheme_gives_host_keyword(self) -> None:
+        company = {"id": 3, "name": "Alphabet Inc.", "url": "google.com"}
+
+        self.assertEqual(_company_keywords(company), ["alphabet inc.", "alphabet", "google"])
+
+    def test_host_keyword_skips_www_and_country_suffix(self) -> None:
+        company = {"id": 5, "name": "British Broadcasting", "url": "https://www.bbc.co.uk"}
+
+        self.assertEqual(_company_keywords(company)[-1], "bbc")
+
+    def test_text_naming_only_the_host_keyword_is_kept(self) -> None:
+        database = [{"id": 3, "name": "Alphabet Inc.", "url": "google.com"}]
+
+        self.assertTrue(_mentions_any_company("Google announced earnings", database))
+
+    def test_malformed_url_gives_no_host_keyword(self) -> None:
+        company = {"id": 1, "name": "Acme Corp", "url": "https://a]b.com"}
+
+        self.assertEqual(_company_keywords(company), ["acme corp", "acme"])
+
+    def test_malformed_url_does_not_break_keyword_scan(self) -> None:
+        database = [{"id": 1, "name": "Acme Corp", "url": "https://a]b.com"}]
+
+        self.assertTrue(_mentions_any_company("Acme shipped anvils", database))
+        self.assertFalse(_mentions_any_company("Nothing to see here", database))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,402 @@
+"""Tests for the contract decorators."""
+
+import functools
+import linecache
+import unittest
+from typing import Any, Tuple
+from unittest import mock
+
+import contracts
+from contracts import (
+    InvariantViolation,
+    PreconditionViolation,
+    cached_condition,
+    contract,
+    disable_contracts,
+    enable_contracts,
+    invariant,
+    postcondition,
+    precondition,
+    pure,
+)
+
+
+class CachedConditionTests(unittest.TestCase):
+    def setUp(self) -> None:
+        enable_contracts()
+
+    def tearDown(self) -> None:
+        disable_contracts()
+
+    def test_equal_values_of_different_types_are_cached_separately(self) -> None:
+        @cached_condition
+        def all_ints(values: Tuple[Any, ...]) -> bool:
+            return all(type(value) is int for value in values)
+
+        self.assertTrue(all_ints((1,)))
+        self.assertFalse(all_ints((1.0,)))
+        self.assertFalse(all_ints((True,)))
+        self.assertTrue(all_ints((1,)))
+
+    def test_cached_precondition_rejects_equal_value_of_wrong_type(self) -> None:
+        @cached_condition
+        def all_ints(values: Tuple[Any, ...]) -> bool:
+            return all(type(value) is int for value in values)
+
+        @precondition(all_ints)
+        def total(values: Tuple[Any, ...]) -> Any:
+            return sum(values)
+
+        self.assertEqual(total((1,)), 1)
+        with self.assertRaises(PreconditionViolation):
+            total((1.0,))
+
+    def test_repeated_hashable_call_is_not_reevaluated(self) -> None:
+        calls = []
+
+        @cached_condition
+        def positive(value: int) -> bool:
+            calls.append(value)
+            return value > 0
+
+        self.assertTrue(positive(3))
+        self.assertTrue(positive(3))
+        self.assertEqual(calls, [3])
+
+    def test_unhashable_arguments_are_evaluated_directly(self) -> None:
+        calls = []
+
+        @cached_condition
+        def nonempty(values: Any) -> bool:
+            calls.append(list(values))
+            return len(values) > 0
+
+        self.assertTrue(nonempty([1]))
+        self.assertTrue(nonempty([1]))
+        self.assertEqual(len(calls), 2)
+
+
+class StackedContractTests(unittest.TestCase):
+    def setUp(self) -> None:
+        enable_contracts()
+
+    def tearDown(self) -> None:
+        disable_contracts()
+
+    def test_decorating_a_checked_function_leaves_it_unchanged(self) -> None:
+        @precondition(lambda x: x < 100)
+        def f(x: int) -> int:
+            return x
+
+        g = precondition(lambda x: x < 10)(f)
+
+        self.assertIsNot(g, f)
+        self.assertEqual(f(50), 50)
+        with self.assertRaises(PreconditionViolation):
+            g(50)
+
+    def test_checks_run_in_decorator_order(self) -> None:
+        order = []
+
+        def check(label: str) -> Any:
+            def condition(*args: Any) -> bool:
+                order.append(label)
+                return True
+            return condition
+
+        @precondition(check('pre1'))
+        @postcondition(check('post1'))
+        @invariant(check('inv1'))
+        @precondition(check('pre2'))
+        @invariant(check('inv2'))
+        @postcondition(check('post2'))
+        def f(x: int) -> int:
+            order.append('call')
+            return x
+
+        f(1)
+        self.assertEqual(order, [
+            'pre1', 'inv1', 'pre2', 'inv2', 'call', 'post2', 'inv2', 'inv1', 'post1',
+        ])
+
+    def test_callables_without_a_name_can_be_decorated(self) -> None:
+        class Identity:
+            def __call__(self, x: int) -> int:
+                return x
+
+        def add(a: int, b: int) -> int:
+            return a + b
+
+        checked_partial = precondition(lambda b: b > 0)(functools.partial(add, 1))
+        checked_instance = precondition(lambda x: x > 0)(Identity())
+
+        self.assertEqual(checked_partial(2), 3)
+        self.assertEqual(checked_instance(3), 3)
+        with self.assertRaises(PreconditionViolation):
+            checked_instance(-1)
+
+    def test_outermost_only_postcondition_checks_recursion_once(self) -> None:
+        calls = []
+
+        def counted(result: int, n: int) -> bool:
+            calls.append(n)
+            return result >= 1
+
+        class Positive:
+            __hash__ = None  # type: ignore[assignment]
+
+            def __eq__(self, other: object) -> bool:
+                return isinstance(other, Positive)
+
+            def __call__(self, result: int, n: int) -> bool:
+                return result > 0
+
+        @postcondition(counted, outermost_only=True)
+        @postcondition(Positive())
+        def fact(n: int) -> int:
+            return 1 if n <= 1 else n * fact(n - 1)
+
+        self.assertEqual(fact(5), 120)
+        self.assertEqual(calls, [5])
+
+
+class ContractDecoratorTests(unittest.TestCase):
+    def setUp(self) -> None:
+        enable_contracts()
+
+    def tearDown(self) -> None:
+        disable_contracts()
+
+    def test_checks_run_in_contract_order(self) -> None:
+        order = []
+
+        def check(label: str) -> Any:
+            def condition(*args: Any) -> bool:
+                order.append(label)
+                return True
+            return condition
+
+        @contract(
+            preconditions=[check('pre1'), check('pre2')],
+            postconditions=[check('post1'), check('post2')],
+            invariants=[check('inv1'), check('inv2')],
+        )
+        def f(x: int) -> int:
+            order.append('call')
+            return x
+
+        f(1)
+        self.assertEqual(order, [
+            'pre1', 'pre2', 'inv1', 'inv2', 'call', 'inv2', 'inv1', 'post1', 'post2',
+        ])
+
+    def test_metadata_is_recorded(self) -> None:
+        def positive(x: int) -> bool:
+            return x > 0
+
+        def returns_input(result: int, x: int) -> bool:
+            return result == x
+
+        @contract(
+            specification='Returns its argument',
+            pre_description='x is positive',
+            post_description='Returns x',
+            invariant_description='x stays positive',
+            raises=[ValueError, PreconditionViolation],
+            preconditions=[positive],
+            postconditions=[returns_input],
+            invariants=[positive],
+        )
+        def f(x: int) -> int:
+            return x
+
+        self.assertEqual(f._contract_metadata, {
+            'specification': 'Returns its argument',
+            'pre_description': 'x is positive',
+            'post_description': 'Returns x',
+            'invariant_description': 'x stays positive',
+            'raises': frozenset([ValueError, PreconditionViolation]),
+            'raises_order': (ValueError, PreconditionViolation),
+            'preconditions': [positive],
+            'postconditions': [returns_input],
+            'invariants': [positive],
+        })
+        self.assertEqual(f(1), 1)
+        with self.assertRaises(PreconditionViolation):
+            f(0)
+
+    def test_without_conditions_returns_the_function(self) -> None:
+        def f(x: int) -> int:
+            return x
+
+        g = contract(specification='Returns its argument')(f)
+
+        self.assertIs(g, f)
+        self.assertEqual(f._contract_metadata, {
+            'specification': 'Returns its argument',
+        })
+
+
+class PureTests(unittest.TestCase):
+    def setUp(self) -> None:
+        enable_contracts()
+
+    def tearDown(self) -> None:
+        disable_contracts()
+
+    def counted_invariant(self) -> Any:
+        self.calls = 0
+
+        def nonnegative(x: int) -> bool:
+            self.calls += 1
+            return x >= 0
+        return nonnegative
+
+    def test_invariant_is_checked_before_and_after_the_call(self) -> None:
+        @invariant(self.counted_invariant())
+        def f(x: int) -> int:
+            return x
+
+        f(1)
+        self.assertEqual(self.calls, 2)
+
+    def test_pure_below_invariant_skips_the_check_after_the_call(self) -> None:
+        @invariant(self.counted_invariant())
+        @pure
+        def f(x: int) -> int:
+            return x
+
+        f(1)
+        self.assertEqual(self.calls, 1)
+
+    def test_pure_above_invariant_skips_the_check_after_the_call(self) -> None:
+        @pure
+        @invariant(self.counted_invariant())
+        def f(x: int) -> int:
+            return x
+
+        f(1)
+        self.assertEqual(self.calls, 1)
+
+    def test_pure_still_checks_the_invariant_before_the_call(self) -> None:
+        @pure
+        @invariant(self.counted_invariant())
+        def f(x: int) -> int:
+            return x
+
+        with self.assertRaises(InvariantViolation):
+            f(-1)
+
+
+class GeneratedWrapperTests(unittest.TestCase):
+    def tearDown(self) -> None:
+        disable_contracts()
+
+    def test_fixed_signature_gets_generated_wrapper(self) -> None:
+        @precondition(lambda a, b: b != 0)
+        def div(a: int, b: int) -> int:
+            return a // b
+
+        self.assertTrue(div.__code__.co_filename.startswith('<contract wrapper'))
+        self.assertEqual(div(7, 2), 3)
+        self.assertEqual(div(b=2, a=7), 3)
+
+    def test_generated_wrapper_follows_checking_flag(self) -> None:
+        @precondition(lambda a, b: b != 0)
+        def div(a: int, b: int) -> int:
+            return a // b
+
+        with self.assertRaises(ZeroDivisionError):
+            div(1, 0)
+        enable_contracts()
+        with self.assertRaises(PreconditionViolation):
+            div(1, 0)
+
+    def test_positional_only_parameters_are_kept(self) -> None:
+        @precondition(lambda a, b: True)
+        def sub(a: int, b: int, /) -> int:
+            return a - b
+
+        self.assertTrue(sub.__code__.co_filename.startswith('<contract wrapper'))
+        self.assertEqual(sub(5, 1), 4)
+        with self.assertRaises(TypeError):
+            sub(a=5, b=1)
+
+    def test_defaults_fall_back_to_generic_wrapper(self) -> None:
+        @precondition(lambda a, b=1: True)
+        def add(a: int, b: int = 1) -> int:
+            return a + b
+
+        self.assertFalse(add.__code__.co_filename.startswith('<contract wrapper'))
+        self.assertEqual(add(1), 2)
+
+    def test_wrong_arguments_raise_type_error(self) -> None:
+        enable_contracts()
+
+        @precondition(lambda a, b: b != 0)
+        def div(a: int, b: int) -> int:
+            return a // b
+
+        with self.assertRaises(TypeError):
+            div(1)
+
+    def test_generated_source_is_available_to_tracebacks(self) -> None:
+        @precondition(lambda a, b: True)
+        def div(a: int, b: int) -> int:
+            return a // b
+
+        filename = div.__code__.co_filename
+        self.assertIn('def wrapper(a, b):', linecache.getline(filename, 2))
+
+
+class OptimizedContractTests(unittest.TestCase):
+    def setUp(self) -> None:
+        patcher = mock.patch.object(contracts, '_CONTRACTS_OPTIMIZED', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        enable_contracts()
+
+    def tearDown(self) -> None:
+        disable_contracts()
+
+    def test_logical_decorators_return_the_function_and_record_metadata(self) -> None:
+        def positive(x: int) -> bool:
+            return x > 0
+
+        def returns_input(result: int, x: int) -> bool:
+            return result == x
+
+        def f(x: int) -> int:
+            return x
+
+        decorated = precondition(positive)(
+            postcondition(returns_input)(invariant(positive)(f))
+        )
+
+        self.assertIs(decorated, f)
+        self.assertEqual(f._contract_metadata, {
+            'invariants': [positive],
+            'postconditions': [returns_input],
+            'preconditions': [positive],
+        })
+        self.assertEqual(decorated(-1), -1)
+
+    def test_contract_returns_the_function_and_records_metadata(self) -> None:
+        def positive(x: int) -> bool:
+            return x > 0
+
+        def f(x: int) -> int:
+            return x
+
+        decorated = contract(preconditions=[positive], invariants=[positive])(f)
+
+        self.assertIs(decorated, f)
+        self.assertEqual(f._contract_metadata, {
+            'preconditions': [positive],
+            'invariants': [positive],
+        })
+        self.assertEqual(decorated(-1), -1)
+
+
+if __name__ == '__main__':
+    unittest.main()